@@ -9,13 +9,18 @@ Order of backends:
 from __future__ import annotations
 
 import hashlib
+import logging
+from concurrent.futures import ThreadPoolExecutor
 from functools import lru_cache
-from typing import List
+from typing import Iterable, Iterator, List, Tuple
 import os
 
-# Load .env for local dev
+import numpy as np
+
+# Load .env for local dev (server/.env first, then nearest to the caller)
 try:  # pragma: no cover
 	from dotenv import load_dotenv  # type: ignore
+	load_dotenv(os.path.join(os.path.dirname(__file__), ".env"))
 	load_dotenv()
 except Exception:
 	pass
@@ -25,81 +30,267 @@ try:  # pragma: no cover - optional heavy dependency
 except Exception:  # pragma: no cover
 	SentenceTransformer = None  # type: ignore
 
+try:  # pragma: no cover - optional, used for token-aware batching
+	import tiktoken  # type: ignore
+except Exception:  # pragma: no cover
+	tiktoken = None  # type: ignore
+
 try:  # OpenAI SDK new client
 	from openai import OpenAI  # type: ignore
 except Exception:  # pragma: no cover
 	OpenAI = None  # type: ignore
-	
-dotenv_path = os.path.join(os.path.dirname(__file__), ".env")
-load_dotenv(dotenv_path)
+
+logger = logging.getLogger(__name__)
 
 MODEL_NAME = "all-MiniLM-L6-v2"
+ST_BATCH_SIZE = 64
 OPENAI_EMBED_MODEL = os.getenv("OPENAI_EMBED_MODEL", "text-embedding-3-small")
+# Max in-flight embedding requests; raise for higher OpenAI rate-limit tiers
+OPENAI_EMBED_CONCURRENCY = max(1, int(os.getenv("OPENAI_EMBED_CONCURRENCY", "8")))
+# Packing limits: OpenAI caps each input at 8191 tokens (guarded at 7500 for
+# tokenizer drift) and each request at 2048 inputs / 300k summed tokens.
+OPENAI_EMBED_MAX_INPUT_TOKENS = 7500
+OPENAI_EMBED_MAX_REQUEST_TOKENS = 300_000
+OPENAI_EMBED_MAX_ITEMS = 2048
+
+# Backend selection is resolved once at import rather than on every call
+_VECTOR_BACKEND = os.getenv("VECTOR_BACKEND", "memory").lower()
+_API_KEY = os.getenv("OPENAI_API_KEY", "")
+# Hashing stub digest; "sha256" reproduces the older 32-dim stub vectors
+_STUB_HASH = os.getenv("EMBED_STUB_HASH", "blake2b").lower()
+if _STUB_HASH not in ("blake2b", "sha256"):
+	raise ValueError(f"EMBED_STUB_HASH must be 'blake2b' or 'sha256', got {_STUB_HASH!r}")
+_USE_OPENAI = OpenAI is not None and bool(_API_KEY) and not _API_KEY.lower().startswith("test")
 
 
 @lru_cache(maxsize=1)
 def _get_model():
 	if SentenceTransformer is None:
 		return None
+	device = os.getenv("ST_DEVICE")
+	try:  # pragma: no cover - torch ships with sentence-transformers
+		import torch  # type: ignore
+		torch.set_num_threads(int(os.getenv("ST_THREADS", "0")) or min(8, os.cpu_count() or 4))
+		if not device:
+			device = "cuda" if torch.cuda.is_available() else "cpu"
+	except Exception:
+		pass
+	try:
+		return SentenceTransformer(MODEL_NAME, device=device)
+	except Exception:
+		return None
+
+
+@lru_cache(maxsize=1)
+def _openai_client():
+	# One client (and HTTP connection pool) shared by every embedding call
+	return OpenAI()
+
+
+@lru_cache(maxsize=1)
+def _get_encoder():
+	if tiktoken is None:
+		return None
 	try:
-		return SentenceTransformer(MODEL_NAME)
+		return tiktoken.encoding_for_model(OPENAI_EMBED_MODEL)
+	except KeyError:
+		return tiktoken.get_encoding("cl100k_base")
 	except Exception:
+		# BPE files are fetched on first use; offline we fall back to estimates
 		return None
 
 
-def embed_texts(texts: List[str]) -> List[List[float]]:
+def _count_tokens(texts: List[str]) -> List[int]:
+	enc = _get_encoder()
+	if enc is None:
+		# Conservative estimate (~3 chars/token; English averages closer to 4)
+		return [len(t) // 3 + 1 for t in texts]
+	# Abstracts may contain literal "<|endoftext|>"; count it as plain text
+	return [len(toks) for toks in enc.encode_batch(texts, disallowed_special=())]
+
+
+def _pack_batches(
+	texts: List[str],
+	max_tokens: int = OPENAI_EMBED_MAX_REQUEST_TOKENS,
+	max_items: int = OPENAI_EMBED_MAX_ITEMS,
+	max_input_tokens: int = OPENAI_EMBED_MAX_INPUT_TOKENS,
+) -> List[List[str]]:
+	"""Greedily pack texts into request-sized batches by token count.
+
+	Inputs over the per-input guard get a request of their own, so if
+	OpenAI rejects one it does not take its neighbours down with it.
+	"""
+	batches: List[List[str]] = []
+	batch: List[str] = []
+	batch_tokens = 0
+	for text, n in zip(texts, _count_tokens(texts)):
+		if n > max_input_tokens:
+			if batch:
+				batches.append(batch)
+				batch, batch_tokens = [], 0
+			batches.append([text])
+			continue
+		if batch and (batch_tokens + n > max_tokens or len(batch) >= max_items):
+			batches.append(batch)
+			batch, batch_tokens = [], 0
+		batch.append(text)
+		batch_tokens += n
+	if batch:
+		batches.append(batch)
+	return batches
+
+
+def _is_request_too_large(e: Exception) -> bool:
+	# Only context-length rejections are worth bisecting; other 400s
+	# (e.g. an empty input) would fail again at every split
+	msg = str(e)
+	return (
+		getattr(e, "code", None) == "context_length_exceeded"
+		or "context_length_exceeded" in msg
+		or "maximum context length" in msg
+	)
+
+
+def _batch_openai_embeddings(texts: List[str]) -> np.ndarray:
+	"""Embed texts via OpenAI, dispatching batches concurrently.
+
+	Texts are packed into batches by token count and sent from a bounded
+	thread pool (``OPENAI_EMBED_CONCURRENCY``); results are reassembled in
+	input order. A batch rejected as too large is bisected and retried.
+	"""
+	client = _openai_client()
+	batches = _pack_batches(texts)
+
+	def _embed_batch(batch: List[str]) -> np.ndarray:
+		try:
+			resp = client.embeddings.create(model=OPENAI_EMBED_MODEL, input=batch)
+		except Exception as e:
+			if len(batch) > 1 and _is_request_too_large(e):
+				mid = len(batch) // 2
+				return np.concatenate((_embed_batch(batch[:mid]), _embed_batch(batch[mid:])))
+			logger.warning("OpenAI embedding error in batch: %s", e)
+			raise
+		return np.asarray([d.embedding for d in resp.data], dtype=np.float32)
+
+	if len(batches) <= 1:
+		return _embed_batch(batches[0]) if batches else np.empty((0, 0), dtype=np.float32)
+	workers = min(OPENAI_EMBED_CONCURRENCY, len(batches))
+	with ThreadPoolExecutor(max_workers=workers) as pool:
+		results = list(pool.map(_embed_batch, batches))
+	return np.concatenate(results)
+
+
+def _embed_st(texts: List[str]) -> np.ndarray:
+	model = _get_model()
+	if model is None:
+		raise RuntimeError("sentence-transformers model unavailable")
+	# encode() already length-sorts inputs into mini-batches and
+	# restores the original order, so no pre-sorting is needed here
+	return model.encode(texts, batch_size=ST_BATCH_SIZE, show_progress_bar=False, normalize_embeddings=True, convert_to_numpy=True).astype(np.float32, copy=False)  # type: ignore
+
+
+def _embed_stub(texts: List[str], algo: str) -> np.ndarray:
+	# Deterministic hashing stub: blake2b (or sha256) -> bytes -> floats 0-1
+	if algo == "sha256":
+		digests = b"".join(hashlib.sha256(t.encode("utf-8")).digest() for t in texts)
+	elif algo == "blake2b":
+		digests = b"".join(hashlib.blake2b(t.encode("utf-8"), digest_size=64).digest() for t in texts)
+	else:
+		raise ValueError(f"Unknown stub hash: {algo}")
+	arr = np.frombuffer(digests, dtype=np.uint8).reshape(len(texts), -1).astype(np.float32)
+	arr *= 1.0 / 255.0
+	return arr
+
+
+def _iter_backends() -> Iterator[str]:
+	"""Names of the usable backends, best first; the stub always comes last.
+
+	Lazy on purpose: sentence-transformers (torch + model load) is only
+	probed once the caller actually moves past OpenAI.
+	"""
 	# Always use OpenAI embeddings if VECTOR_BACKEND is pinecone
-	vector_backend = os.getenv("VECTOR_BACKEND", "memory").lower()
-	api_key = os.getenv("OPENAI_API_KEY", "")
-	print(f"[embedding] VECTOR_BACKEND={vector_backend} OPENAI_API_KEY={'set' if api_key else 'unset'} OpenAI={'yes' if OpenAI else 'no'}")
-	if OpenAI is not None and api_key and not api_key.lower().startswith("test"):
-		def batch_openai_embeddings(texts, batch_size=100):
-			client = OpenAI()
-			all_embeddings = []
-			for i in range(0, len(texts), batch_size):
-				batch = texts[i:i+batch_size]
-				# Check total tokens in batch, if too large, reduce batch size
-				# For simplicity, assume max 3000 tokens per text, adjust as needed
-				try:
-					resp = client.embeddings.create(model=OPENAI_EMBED_MODEL, input=batch)
-					all_embeddings.extend([d.embedding for d in resp.data])
-				except Exception as e:
-					print(f"[embedding] OpenAI embedding error in batch: {e}")
-					raise
-			return all_embeddings
-
-		if vector_backend == "pinecone":
-			try:
-				print("[embedding] Using OpenAI embeddings for Pinecone backend (with batching).")
-				return batch_openai_embeddings(texts)
-			except Exception as e:
-				print(f"[embedding] OpenAI embedding error (pinecone): {e}")
-		else:
-			try:
-				print("[embedding] Using OpenAI embeddings (with batching).")
-				return batch_openai_embeddings(texts)
-			except Exception as e:
-				print(f"[embedding] OpenAI embedding error: {e}")
-
-	# 2) sentence-transformers (only if not using Pinecone)
-	if vector_backend != "pinecone":
-		model = _get_model()
-		if model is not None:
-			try:
-				print("[embedding] Using sentence-transformers.")
-				return model.encode(texts, normalize_embeddings=True).tolist()  # type: ignore
-			except Exception as e:
-				print(f"[embedding] sentence-transformers error: {e}")
-
-	# 3) Deterministic hashing stub: sha256 -> bytes -> floats 0-1
-	print("[embedding] Using deterministic hashing stub.")
-	vectors: List[List[float]] = []
-	for t in texts:
-		h = hashlib.sha256(t.encode("utf-8")).digest()[:512]
-		vec = [b / 255.0 for b in h]
-		vectors.append(vec)
-	return vectors
-
-
-__all__ = ["embed_texts", "MODEL_NAME"]
+	if _USE_OPENAI:
+		yield f"openai:{OPENAI_EMBED_MODEL}"
+	# sentence-transformers only if not using Pinecone
+	if _VECTOR_BACKEND != "pinecone" and _get_model() is not None:
+		yield f"st:{MODEL_NAME}"
+	yield f"stub:{_STUB_HASH}"
+
+
+def _preferred_backend() -> str:
+	return next(_iter_backends())
+
+
+def _run_backend(backend: str, texts: List[str]) -> np.ndarray:
+	kind, _, variant = backend.partition(":")
+	if kind == "openai":
+		return _batch_openai_embeddings(texts)
+	if kind == "st":
+		return _embed_st(texts)
+	if kind == "stub":
+		return _embed_stub(texts, variant)
+	raise ValueError(f"Unknown embedding backend: {backend}")
+
+
+def _embed_first(texts: List[str], backends: Iterable[str]) -> Tuple[np.ndarray, str]:
+	"""Embed with the first backend that succeeds; re-raise the last error."""
+	error: Exception | None = None
+	for backend in backends:
+		try:
+			logger.debug("Embedding %d texts with %s.", len(texts), backend)
+			return _run_backend(backend, texts), backend
+		except Exception as e:
+			logger.warning("%s embedding error: %s", backend, e)
+			error = e
+	if error is None:
+		raise ValueError("No embedding backend given")
+	raise error
+
+
+def embed_with_backend(texts: List[str], backend: str | None = None) -> Tuple[np.ndarray, str]:
+	"""Embed texts and report which backend produced the vectors.
+
+	By default backends are tried best-first, falling back on error. Passing
+	a ``backend`` name from an earlier call pins it: only that backend is
+	used and its errors propagate, so vectors embedded across several calls
+	stay in one space.
+	"""
+	if not texts:
+		return np.empty((0, 0), dtype=np.float32), backend or _preferred_backend()
+	return _embed_first(texts, [backend] if backend else _iter_backends())
+
+
+def embed_texts(texts: List[str]) -> np.ndarray:
+	"""Embed texts as a float32 array of shape (len(texts), dim)."""
+	return embed_with_backend(texts)[0]
+
+
+@lru_cache(maxsize=4096)
+def _embed_one(text: str, backend: str) -> tuple[float, ...]:
+	# Raises if the backend fails, and lru_cache never caches an exception,
+	# so fallback vectors can't get pinned in the cache
+	return tuple(embed_with_backend([text], backend)[0][0].tolist())
+
+
+def embed_one_cached(text: str, backend: str | None = None) -> tuple[float, ...]:
+	"""Embed a single text, memoized so repeated queries skip the backend.
+
+	With ``backend`` (the one that built the vector store) only that backend
+	is used, so queries always match the indexed vectors; errors propagate.
+	Without it, the preferred backend's vectors are cached and a failure
+	falls back to the next backend uncached. Returns a tuple so cached
+	values cannot be mutated by callers. Hit/miss counts are available via
+	``_embed_one.cache_info()``.
+	"""
+	try:
+		return _embed_one(text, backend or _preferred_backend())
+	except Exception as e:
+		fallbacks = [] if backend else list(_iter_backends())[1:]
+		if not fallbacks:
+			raise
+		logger.warning("Query embedding error, falling back uncached: %s", e)
+		return tuple(_embed_first([text], fallbacks)[0][0].tolist())
+
+
+__all__ = ["embed_texts", "embed_with_backend", "embed_one_cached", "MODEL_NAME"]
 
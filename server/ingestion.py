@@ -7,35 +7,66 @@ Replace / extend with PDF / HTML parsing later. For now we accept a list of
 from __future__ import annotations
 
 import re
+import time
 import uuid
-from typing import Iterable, Dict, Any, List
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, as_completed, wait
+from typing import Iterable, Iterator, Dict, Any, List, Tuple
 
-from .embedding import embed_texts
+from .embedding import embed_with_backend
 from .vector_store import Document, get_store
 import os
 import csv
 
+# Chunks per embed+upsert batch and number of batches processed concurrently
+INGEST_BATCH_SIZE = 100
+INGEST_WORKERS = 4
+# Retries per batch on the pinned backend, starting at INGEST_RETRY_BACKOFF seconds
+INGEST_RETRIES = 3
+INGEST_RETRY_BACKOFF = 1.0
+
 
 def _chunk_text(text: str, max_tokens: int = 400, overlap: int = 60) -> List[str]:
-	# naive token approximation using words
+	# naive token approximation using words; join once and slice windows out
+	# of the whitespace-normalized text instead of re-joining every window
 	words = text.split()
+	if not words:
+		return []
+	joined = " ".join(words)
+	starts = []
+	pos = 0
+	for w in words:
+		starts.append(pos)
+		pos += len(w) + 1
 	chunks = []
 	step = max_tokens - overlap
 	for start in range(0, len(words), step):
-		window = words[start : start + max_tokens]
-		if not window:
-			break
-		chunks.append(" ".join(window))
+		end = min(start + max_tokens, len(words))
+		chunks.append(joined[starts[start] : starts[end - 1] + len(words[end - 1])])
 		if start + max_tokens >= len(words):
 			break
 	return chunks
 
 
-def ingest(items: Iterable[Dict[str, Any]]):
-	store = get_store()
-	all_texts: List[str] = []
-	docs: List[Document] = []
+def iter_csv_items(csv_path: str) -> Iterator[Dict[str, Any]]:
+	"""Yield ingest items from a PubMed CSV one row at a time."""
+	with open(csv_path, newline="", encoding="utf-8") as f:
+		for row in csv.DictReader(f):
+			text = row.get("abstract") or row.get("full_text") or ""
+			yield {
+				"title": row.get("title", ""),
+				"text": text,
+				"pmid": row.get("pmid", ""),
+				"authors": row.get("authors", ""),
+				"date": row.get("date", ""),
+				"full_text_link": row.get("full_text_link", ""),
+			}
+
+
+def _iter_batches(items: Iterable[Dict[str, Any]], batch_size: int) -> Iterator[Tuple[List[str], List[str], List[Document]]]:
+	"""Chunk items lazily and yield (ids, texts, docs) batches of batch_size."""
 	ids: List[str] = []
+	texts: List[str] = []
+	docs: List[Document] = []
 	for item in items:
 		title = item.get("title", "")
 		text = item.get("text", "")
@@ -43,18 +74,77 @@ def ingest(items: Iterable[Dict[str, Any]]):
 		for chunk in _chunk_text(text):
 			meta = dict(base_meta)
 			meta["title"] = title
-			doc = Document(page_content=chunk, metadata=meta)
-			docs.append(doc)
-			all_texts.append(chunk)
+			docs.append(Document(page_content=chunk, metadata=meta))
+			texts.append(chunk)
 			ids.append(str(uuid.uuid4()))
-	if not docs:
-		return 0
-	vectors = embed_texts(all_texts)
-	store.add(ids, vectors, docs)
+			if len(texts) >= batch_size:
+				yield ids, texts, docs
+				ids, texts, docs = [], [], []
+	if texts:
+		yield ids, texts, docs
+
+
+def _embed_pinned(texts: List[str], backend: str):
+	# The backend is pinned, so ride out transient errors (rate limits,
+	# timeouts) with exponential backoff rather than failing the ingest
+	for attempt in range(INGEST_RETRIES + 1):
+		try:
+			return embed_with_backend(texts, backend)[0]
+		except Exception as e:
+			if attempt == INGEST_RETRIES:
+				raise
+			delay = INGEST_RETRY_BACKOFF * 2 ** attempt
+			print(f"[ingestion] {backend} batch failed ({e}); retrying in {delay:.1f}s")
+			time.sleep(delay)
+
+
+def _embed_and_add(store, ids: List[str], texts: List[str], docs: List[Document], backend: str) -> int:
+	store.add(ids, _embed_pinned(texts, backend), docs)
 	return len(docs)
 
 
-__all__ = ["ingest"]
+def ingest(
+	items: Iterable[Dict[str, Any]],
+	batch_size: int = INGEST_BATCH_SIZE,
+	workers: int = INGEST_WORKERS,
+	backend: str | None = None,
+):
+	"""Chunk, embed and store items; returns the number of chunks stored.
+
+	Batches are embedded and upserted on a small thread pool so embedding
+	and vector-store round-trips overlap. At most ``2 * workers`` batches are
+	in flight, which keeps memory bounded while chunking runs ahead.
+
+	Every batch uses one embedding backend: ``backend`` if given, otherwise
+	whichever backend the first batch resolves to (with fallback). A later
+	batch failing on that backend raises instead of falling back, since
+	mixing backends would mix vector dimensions in the store; each batch
+	is first retried ``INGEST_RETRIES`` times with exponential backoff.
+	"""
+	store = get_store()
+	batches = _iter_batches(items, batch_size)
+	total = 0
+	if backend is None:
+		first = next(batches, None)
+		if first is None:
+			return 0
+		ids, texts, docs = first
+		vectors, backend = embed_with_backend(texts)
+		store.add(ids, vectors, docs)
+		total += len(docs)
+	inflight = set()
+	with ThreadPoolExecutor(max_workers=workers) as pool:
+		for ids, texts, docs in batches:
+			if len(inflight) >= 2 * workers:
+				done, inflight = wait(inflight, return_when=FIRST_COMPLETED)
+				total += sum(f.result() for f in done)
+			inflight.add(pool.submit(_embed_and_add, store, ids, texts, docs, backend))
+		for f in as_completed(inflight):
+			total += f.result()
+	return total
+
+
+__all__ = ["ingest", "iter_csv_items"]
 
 
 if __name__ == "__main__":  # simple CLI
@@ -68,19 +158,5 @@ if __name__ == "__main__":  # simple CLI
 	if not os.path.exists(csv_path):
 		print(f"CSV not found: {csv_path}")
 		sys.exit(1)
-	items = []
-	with open(csv_path, newline="", encoding="utf-8") as f:
-		reader = csv.DictReader(f)
-		for row in reader:
-			text = row.get("abstract") or row.get("full_text") or ""
-			items.append({
-				"title": row.get("title", ""),
-				"text": text,
-				"pmid": row.get("pmid", ""),
-				"authors": row.get("authors", ""),
-				"date": row.get("date", ""),
-				"full_text_link": row.get("full_text_link", ""),
-			})
-	n = ingest(items)
+	n = ingest(iter_csv_items(csv_path))
 	print(f"Ingested chunks: {n}")
-
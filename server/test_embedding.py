@@ -0,0 +1,119 @@
+import os
+import subprocess
+import sys
+from types import SimpleNamespace
+
+import pytest
+
+from server import embedding
+
+
+class _FakeEmbeddings:
+	def create(self, model, input):
+		if len(input) > 40:
+			raise RuntimeError("context_length_exceeded")
+		return SimpleNamespace(data=[SimpleNamespace(embedding=[float(t)]) for t in input])
+
+
+class _FakeOpenAI:
+	def __init__(self):
+		self.embeddings = _FakeEmbeddings()
+
+
+def test_batch_openai_embeddings_preserves_order(monkeypatch):
+	monkeypatch.setattr(embedding, "_openai_client", _FakeOpenAI)
+	texts = [str(i) for i in range(250)]
+	out = embedding._batch_openai_embeddings(texts)
+	assert out.dtype == "float32"
+	assert out.tolist() == [[float(i)] for i in range(250)]
+
+
+def test_pack_batches_respects_token_and_item_limits(monkeypatch):
+	monkeypatch.setattr(embedding, "_count_tokens", lambda texts: [len(t) for t in texts])
+	texts = ["a" * 4, "b" * 4, "c" * 9, "d", "e", "f"]
+	batches = embedding._pack_batches(texts, max_tokens=8, max_items=2, max_input_tokens=5)
+	assert batches == [["a" * 4, "b" * 4], ["c" * 9], ["d", "e"], ["f"]]
+
+
+def test_pack_batches_keeps_typical_chunks_in_one_request(monkeypatch):
+	# ~490 tokens per 400-word chunk, as in the PubMed corpus
+	monkeypatch.setattr(embedding, "_count_tokens", lambda texts: [490] * len(texts))
+	texts = [str(i) for i in range(100)]
+	assert embedding._pack_batches(texts) == [texts]
+
+
+def test_pack_batches_isolates_oversized_inputs_in_order(monkeypatch):
+	monkeypatch.setattr(embedding, "_count_tokens", lambda texts: [len(t) for t in texts])
+	texts = ["a", "b", "x" * 10, "c"]
+	batches = embedding._pack_batches(texts, max_input_tokens=5)
+	assert batches == [["a", "b"], ["x" * 10], ["c"]]
+
+
+def test_hashing_stub_is_deterministic(monkeypatch):
+	monkeypatch.setattr(embedding, "_USE_OPENAI", False)
+	monkeypatch.setattr(embedding, "_get_model", lambda: None)
+	a, b, c = embedding.embed_texts(["flap", "graft", "flap"])
+	assert (a == c).all() and not (a == b).all()
+	assert len(a) == 64
+	assert all(0.0 <= x <= 1.0 for x in a)
+	assert len(embedding.embed_texts([])) == 0
+
+
+def test_hashing_stub_sha256_parity(monkeypatch):
+	monkeypatch.setattr(embedding, "_USE_OPENAI", False)
+	monkeypatch.setattr(embedding, "_get_model", lambda: None)
+	monkeypatch.setattr(embedding, "_STUB_HASH", "sha256")
+	(vec,) = embedding.embed_texts(["flap"])
+	assert len(vec) == 32
+
+
+def test_batch_openai_embeddings_does_not_split_other_errors(monkeypatch):
+	calls = []
+
+	class _Rejecting:
+		def __init__(self):
+			self.embeddings = self
+
+		def create(self, model, input):
+			calls.append(len(input))
+			err = RuntimeError("Error code: 400 - invalid input")
+			err.status_code = 400
+			raise err
+
+	monkeypatch.setattr(embedding, "_openai_client", _Rejecting)
+	with pytest.raises(RuntimeError):
+		embedding._batch_openai_embeddings(["a", "b", "c", "d"])
+	assert calls == [4]
+
+
+def test_count_tokens_allows_special_token_text(monkeypatch):
+	class _Enc:
+		def encode_batch(self, texts, disallowed_special="all"):
+			assert disallowed_special == ()
+			return [t.split() for t in texts]
+
+	monkeypatch.setattr(embedding, "_get_encoder", lambda: _Enc())
+	assert embedding._count_tokens(["a <|endoftext|> b"]) == [3]
+
+
+def test_unknown_stub_hash_is_rejected():
+	env = dict(os.environ, EMBED_STUB_HASH="blake3")
+	root = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+	proc = subprocess.run(
+		[sys.executable, "-c", "import server.embedding"], cwd=root, env=env, capture_output=True, text=True
+	)
+	assert proc.returncode != 0
+	assert "EMBED_STUB_HASH must be" in proc.stderr
+	with pytest.raises(ValueError, match="Unknown stub hash"):
+		embedding._run_backend("stub:blake3", ["x"])
+
+
+def test_sentence_transformers_not_loaded_while_openai_succeeds(monkeypatch):
+	loads = []
+	monkeypatch.setattr(embedding, "_USE_OPENAI", True)
+	monkeypatch.setattr(embedding, "_get_model", lambda: loads.append(1))
+	monkeypatch.setattr(embedding, "_openai_client", _FakeOpenAI)
+	vectors, backend = embedding.embed_with_backend(["1", "2"])
+	assert backend.startswith("openai:")
+	assert vectors.tolist() == [[1.0], [2.0]]
+	assert loads == []
@@ -0,0 +1,82 @@
+import numpy as np
+import pytest
+
+from server import embedding, ingestion
+from server.ingestion import _chunk_text
+from server.vector_store import InMemoryVectorStore
+
+
+def test_chunk_text_overlapping_windows():
+	text = " ".join(f"w{i}" for i in range(10))
+	chunks = _chunk_text(text, max_tokens=4, overlap=1)
+	assert chunks == ["w0 w1 w2 w3", "w3 w4 w5 w6", "w6 w7 w8 w9"]
+
+
+def test_chunk_text_normalizes_whitespace():
+	assert _chunk_text("  a\n b\t\tc  ", max_tokens=2, overlap=0) == ["a b", "c"]
+	assert _chunk_text("   ") == []
+
+
+def test_ingest_batches_into_store(monkeypatch):
+	store = InMemoryVectorStore()
+	monkeypatch.setattr(ingestion, "get_store", lambda: store)
+	items = [{"title": f"t{i}", "text": f"abstract {i}", "pmid": str(i)} for i in range(25)]
+	assert ingestion.ingest(items, batch_size=4, workers=2) == 25
+	assert store._len == 25
+	assert sorted(d.metadata["pmid"] for d in store._docs) == sorted(str(i) for i in range(25))
+	assert ingestion.ingest([]) == 0
+
+
+def test_iter_csv_items_streams_rows(tmp_path):
+	path = tmp_path / "corpus.csv"
+	path.write_text("pmid,title,abstract,full_text\n1,A,first abstract,\n2,B,,full body\n", encoding="utf-8")
+	items = ingestion.iter_csv_items(str(path))
+	assert next(items) == {"title": "A", "text": "first abstract", "pmid": "1", "authors": "", "date": "", "full_text_link": ""}
+	assert next(items)["text"] == "full body"
+
+
+def _flaky_openai(monkeypatch, fail_calls):
+	calls = []
+
+	def _fake(texts):
+		calls.append(len(texts))
+		if len(calls) in fail_calls:
+			raise RuntimeError("rate limited")
+		return np.ones((len(texts), 8), dtype=np.float32)
+
+	monkeypatch.setattr(embedding, "_USE_OPENAI", True)
+	monkeypatch.setattr(embedding, "_batch_openai_embeddings", _fake)
+	return calls
+
+
+def test_ingest_falls_back_as_a_whole_when_first_batch_fails(monkeypatch):
+	store = InMemoryVectorStore()
+	monkeypatch.setattr(ingestion, "get_store", lambda: store)
+	calls = _flaky_openai(monkeypatch, fail_calls={1})
+	items = [{"title": "t", "text": f"abstract {i}"} for i in range(10)]
+	assert ingestion.ingest(items, batch_size=3, workers=1) == 10
+	assert calls == [3]
+	assert store._len == 10
+	assert store._matrix.shape[1] != 8
+
+
+def test_ingest_retries_a_failed_batch_on_the_pinned_backend(monkeypatch):
+	store = InMemoryVectorStore()
+	monkeypatch.setattr(ingestion, "get_store", lambda: store)
+	monkeypatch.setattr(ingestion, "INGEST_RETRY_BACKOFF", 0)
+	calls = _flaky_openai(monkeypatch, fail_calls={2, 3})
+	items = [{"title": "t", "text": f"abstract {i}"} for i in range(10)]
+	assert ingestion.ingest(items, batch_size=3, workers=1) == 10
+	assert len(calls) == 6
+	assert store._matrix.shape[1] == 8
+
+
+def test_ingest_does_not_mix_backends_when_retries_run_out(monkeypatch):
+	store = InMemoryVectorStore()
+	monkeypatch.setattr(ingestion, "get_store", lambda: store)
+	monkeypatch.setattr(ingestion, "INGEST_RETRY_BACKOFF", 0)
+	_flaky_openai(monkeypatch, fail_calls={2, 3, 4, 5})
+	items = [{"title": "t", "text": f"abstract {i}"} for i in range(10)]
+	with pytest.raises(RuntimeError, match="rate limited"):
+		ingestion.ingest(items, batch_size=3, workers=1)
+	assert store._matrix.shape[1] == 8
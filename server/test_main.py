@@ -1,5 +1,9 @@
+import numpy as np
 from fastapi.testclient import TestClient
-from main import app
+
+from server import embedding, main
+from server.main import app
+from server.vector_store import Document, InMemoryVectorStore
 
 
 def test_health():
@@ -10,8 +14,10 @@ def test_health():
 
 
 def test_chat_stub(monkeypatch):
-	# Force stub mode by clearing API key
+	# Force stub mode: the chat client reads the key per instance, while the
+	# embedding backend is resolved at import and must be patched directly
 	monkeypatch.delenv("OPENAI_API_KEY", raising=False)
+	monkeypatch.setattr(embedding, "_USE_OPENAI", False)
 	client = TestClient(app)
 	r = client.post("/api/chat", json={"question": "What is microsurgery?"})
 	assert r.status_code == 200
@@ -19,3 +25,95 @@ def test_chat_stub(monkeypatch):
 	assert "response" in data
 	assert "STUB" in data["response"]
 
+
+def test_chat_reuses_cached_query_embedding(monkeypatch):
+	monkeypatch.delenv("OPENAI_API_KEY", raising=False)
+	monkeypatch.setattr(embedding, "_USE_OPENAI", False)
+	embedding._embed_one.cache_clear()
+	client = TestClient(app)
+	client.post("/api/chat", json={"question": "What is a DIEP flap?"})
+	client.post("/api/chat", json={"question": "  what is a DIEP flap?"})
+	info = embedding._embed_one.cache_info()
+	assert info.misses == 1
+	assert info.hits == 1
+
+
+def test_chat_context_lists_study_metadata(monkeypatch):
+
+	class _Store:
+		def similarity_search(self, q_vec, k=4):
+			return [Document("Flap survival improved.", {"title": "DIEP", "pmid": "42", "date": "2020"})]
+
+	monkeypatch.delenv("OPENAI_API_KEY", raising=False)
+	monkeypatch.setattr(embedding, "_USE_OPENAI", False)
+	monkeypatch.setattr(main, "get_store", lambda: _Store())
+	client = TestClient(app)
+	r = client.post("/api/chat", json={"question": "flap?"})
+	assert "Title: DIEP\nMeta: pmid=42; authors=; date=2020; full_text_link=" in r.json()["response"]
+
+
+def test_chat_reports_dimension_mismatch(monkeypatch):
+
+	store = InMemoryVectorStore()
+	store.add(["1"], [[1.0, 0.0, 0.0]], [Document("a")])
+	monkeypatch.setattr(embedding, "_USE_OPENAI", False)
+	monkeypatch.setattr(main, "get_store", lambda: store)
+	client = TestClient(app)
+	r = client.post("/api/chat", json={"question": "mismatch?"})
+	assert r.status_code == 503
+	assert "does not match store dimension 3" in r.json()["detail"]
+
+
+def test_query_fallback_vectors_are_not_cached(monkeypatch):
+	calls = []
+
+	def _failing(texts):
+		calls.append(texts)
+		raise RuntimeError("timeout")
+
+	monkeypatch.setattr(embedding, "_USE_OPENAI", True)
+	monkeypatch.setattr(embedding, "_batch_openai_embeddings", _failing)
+	embedding._embed_one.cache_clear()
+	first = embedding.embed_one_cached("what is a tram flap?")
+	second = embedding.embed_one_cached("what is a tram flap?")
+	assert first == second
+	assert len(calls) == 2
+	assert embedding._embed_one.cache_info().currsize == 0
+
+
+def test_startup_survives_ingest_failure(monkeypatch, tmp_path):
+
+	def _boom(*args, **kwargs):
+		raise RuntimeError("OpenAI down")
+
+	store = InMemoryVectorStore()
+	monkeypatch.setattr(embedding, "_USE_OPENAI", False)
+	monkeypatch.setattr(main, "get_store", lambda: store)
+	monkeypatch.setattr(main, "ingest", _boom)
+	monkeypatch.setattr(main, "STORE_CACHE_PATH", str(tmp_path / "store"))
+	with TestClient(app) as client:
+		assert client.get("/health").status_code == 200
+	assert not (tmp_path / "store.pkl").exists()
+
+
+def test_queries_pinned_to_backend_that_built_the_store(monkeypatch, tmp_path):
+
+	openai_up = []
+
+	def _openai(texts):
+		if not openai_up:
+			raise RuntimeError("OpenAI down")
+		return np.ones((len(texts), 8), dtype=np.float32)
+
+	store = InMemoryVectorStore()
+	monkeypatch.delenv("OPENAI_API_KEY", raising=False)
+	monkeypatch.setattr(embedding, "_USE_OPENAI", True)
+	monkeypatch.setattr(embedding, "_batch_openai_embeddings", _openai)
+	monkeypatch.setattr(main, "get_store", lambda: store)
+	monkeypatch.setattr(main, "STORE_CACHE_PATH", str(tmp_path / "store"))
+	monkeypatch.setattr(main, "_store_backend", None)
+	with TestClient(app) as client:
+		assert main._store_backend.startswith("stub:")
+		openai_up.append(True)
+		r = client.post("/api/chat", json={"question": "after recovery?"})
+	assert r.status_code == 200
@@ -0,0 +1,132 @@
+import threading
+
+import numpy as np
+import pytest
+
+from server.vector_store import Document, InMemoryVectorStore, _top_k
+
+
+def test_similarity_search_ranks_by_cosine():
+	store = InMemoryVectorStore()
+	docs = [Document("a"), Document("b"), Document("c")]
+	store.add(["1", "2", "3"], [[1.0, 0.0], [0.0, 1.0], [1.0, 1.0]], docs)
+	res = store.similarity_search([2.0, 0.1], k=2)
+	assert [d.page_content for d in res] == ["a", "c"]
+
+
+def test_similarity_search_k_larger_than_store():
+	store = InMemoryVectorStore()
+	assert store.similarity_search([1.0, 0.0]) == []
+	store.add(["1", "2"], [[0.0, 1.0], [1.0, 0.0]], [Document("a"), Document("b")])
+	store.add(["3"], [[0.0, 0.0]], [Document("zero")])
+	res = store.similarity_search([1.0, 0.0], k=10)
+	assert len(res) == 3
+	assert res[0].page_content == "b"
+
+
+def test_add_grows_matrix_across_calls():
+	store = InMemoryVectorStore()
+	for i in range(40):
+		vec = [0.0] * 40
+		vec[i] = 1.0
+		store.add([str(i)], [vec], [Document(str(i))])
+	assert store._len == 40
+	assert store._matrix.shape[0] >= 40
+	query = [0.0] * 40
+	query[37] = 1.0
+	assert store.similarity_search(query, k=1)[0].page_content == "37"
+
+
+def test_float16_storage_matches_float32_ranking():
+	rows = [[1.0, 0.0, 0.0], [0.6, 0.8, 0.0], [0.0, 0.0, 1.0]]
+	docs = [Document(str(i)) for i in range(3)]
+	results = []
+	for dtype in ("float32", "float16"):
+		store = InMemoryVectorStore(dtype=dtype)
+		store.add(["a", "b", "c"], rows, docs)
+		results.append([d.page_content for d in store.similarity_search([0.9, 0.5, 0.1], k=3)])
+	assert store._matrix.dtype == "float16"
+	assert results[0] == results[1] == ["1", "0", "2"]
+
+
+def test_top_k_orders_best_first():
+	scores = np.array([0.1, 0.9, 0.3, 0.7, 0.5], dtype=np.float32)
+	assert _top_k(scores, 2).tolist() == [1, 3]
+	assert _top_k(scores, 10).tolist() == [1, 3, 4, 2, 0]
+
+
+def test_save_and_load_round_trip(tmp_path):
+	path = str(tmp_path / "store")
+	store = InMemoryVectorStore()
+	store.add(["1", "2"], [[1.0, 0.0], [0.0, 1.0]], [Document("a", {"pmid": "1"}), Document("b")])
+	store.save(path, "v1", "stub:blake2b")
+
+	loaded = InMemoryVectorStore()
+	assert not loaded.load(path, "v2", "stub:blake2b", 2)
+	assert loaded.load(path, "v1", "stub:blake2b", 2)
+	assert loaded.similarity_search([0.1, 1.0], k=1)[0].page_content == "b"
+	loaded.add(["3"], [[1.0, 1.0]], [Document("c")])
+	assert [d.page_content for d in loaded.similarity_search([1.0, 1.0], k=3)][0] == "c"
+	assert not InMemoryVectorStore().load(str(tmp_path / "missing"), "v1", "stub:blake2b", 2)
+
+
+def test_load_rejects_vectors_from_another_backend_or_width(tmp_path):
+	path = str(tmp_path / "store")
+	store = InMemoryVectorStore()
+	store.add(["1"], [[1.0, 0.0]], [Document("a")])
+	# e.g. first boot fell back to the stub while OpenAI was unreachable
+	store.save(path, "v1", "stub:blake2b")
+	assert not InMemoryVectorStore().load(path, "v1", "openai:text-embedding-3-small", 2)
+	assert not InMemoryVectorStore().load(path, "v1", "stub:blake2b", 1536)
+
+
+def test_score_buffer_reused_between_queries():
+	store = InMemoryVectorStore()
+	store.add(["1", "2"], [[1.0, 0.0], [0.0, 1.0]], [Document("a"), Document("b")])
+	store.similarity_search([1.0, 0.0])
+	buf = store._local.scores
+	assert store.similarity_search([0.0, 1.0], k=1)[0].page_content == "b"
+	assert store._local.scores is buf
+	store.add([str(i) for i in range(30)], [[1.0, 1.0]] * 30, [Document("x")] * 30)
+	assert store.similarity_search([1.0, 1.0], k=1)[0].page_content == "x"
+	assert len(store._local.scores) >= 32
+
+
+def test_similarity_search_rejects_dimension_mismatch():
+	store = InMemoryVectorStore()
+	store.add(["1"], [[1.0, 0.0, 0.0]], [Document("a")])
+	with pytest.raises(ValueError, match="Query dimension 2 does not match store dimension 3"):
+		store.similarity_search([1.0, 0.0])
+
+
+def test_search_during_concurrent_adds():
+	store = InMemoryVectorStore()
+	store.add(["0"], [[1.0, 0.0]], [Document("0")])
+	errors = []
+
+	def _writer():
+		for i in range(2000):
+			store.add([str(i)], [[1.0, float(i)]], [Document(str(i))])
+
+	def _reader():
+		try:
+			for _ in range(2000):
+				assert store.similarity_search([1.0, 0.0], k=1)
+		except Exception as e:  # pragma: no cover - surfaced below
+			errors.append(e)
+
+	threads = [threading.Thread(target=_writer), threading.Thread(target=_reader)]
+	for t in threads:
+		t.start()
+	for t in threads:
+		t.join()
+	assert not errors
+
+
+def test_add_rejects_mismatched_lengths():
+	store = InMemoryVectorStore()
+	with pytest.raises(ValueError, match="lengths must match"):
+		store.add(["1"], np.empty((0, 0)), [])
+	with pytest.raises(ValueError, match="lengths must match"):
+		store.add(["1", "2"], [[1.0, 0.0], [0.0, 1.0]], [Document("a")])
+	assert store._len == 0 and store._ids == [] and store._docs == []
@@ -7,9 +7,12 @@ is intentionally tiny: add() and similarity_search().
 
 from __future__ import annotations
 
-import math
 import os
-from typing import List, Dict, Any, Sequence, Tuple
+import pickle
+import threading
+from typing import List, Dict, Any, Sequence
+
+import numpy as np
 from dotenv import load_dotenv
 
 dotenv_path = os.path.join(os.path.dirname(__file__), ".env")
@@ -22,27 +25,173 @@ class Document:
 		self.metadata = metadata or {}
 
 
-def _cosine(a: Sequence[float], b: Sequence[float]) -> float:
-	num = sum(x * y for x, y in zip(a, b))
-	da = math.sqrt(sum(x * x for x in a))
-	db = math.sqrt(sum(y * y for y in b))
-	if da == 0 or db == 0:
-		return 0.0
-	return num / (da * db)
+def _normalize_rows(matrix: np.ndarray) -> np.ndarray:
+	"""L2-normalize each row in place; zero rows are left as zeros."""
+	norms = np.linalg.norm(matrix, axis=1, keepdims=True)
+	norms[norms == 0] = 1.0
+	matrix /= norms
+	return matrix
+
+
+def _top_k(scores: np.ndarray, k: int) -> np.ndarray:
+	"""Indices of the k highest scores, best first, via O(N) partition.
+
+	Selects from the top of an ascending partition rather than negating
+	``scores``, so no N-length value copy is made (argpartition still
+	returns an N-length index array).
+	"""
+	n = len(scores)
+	if k >= n:
+		return np.argsort(scores)[::-1]
+	part = np.argpartition(scores, n - k)[n - k:]
+	return part[np.argsort(scores[part])[::-1]]
+
+
+# Rows upcast per step when scoring a reduced-precision matrix
+_SCORE_BLOCK = 1024
 
 
 class InMemoryVectorStore:
-	def __init__(self):
-		self._data: List[Tuple[str, List[float], Document]] = []
+	"""Vectors live in one contiguous matrix, separate from ids/docs.
 
-	def add(self, ids: List[str], vectors: List[List[float]], docs: List[Document]):
-		for i, v, d in zip(ids, vectors, docs):
-			self._data.append((i, v, d))
+	The matrix is over-allocated and grown by doubling so appends are
+	amortized O(1); only the first ``_len`` rows are valid. Storage dtype
+	defaults to float32; ``VECTOR_STORE_DTYPE=float16`` halves memory at the
+	cost of slower scoring, since NumPy has no BLAS kernel for float16 and
+	rows are upcast block by block instead.
+	"""
 
-	def similarity_search(self, query_vector: List[float], k: int = 4) -> List[Document]:
-		scored = [(_cosine(query_vector, vec), doc) for _id, vec, doc in self._data]
-		scored.sort(key=lambda x: x[0], reverse=True)
-		return [d for _s, d in scored[:k]]
+	def __init__(self, dtype: str | None = None):
+		self._dtype = np.dtype(dtype or os.getenv("VECTOR_STORE_DTYPE", "float32"))
+		if self._dtype not in (np.float32, np.float16):
+			raise ValueError(f"Unsupported vector store dtype: {self._dtype}")
+		self._ids: List[str] = []
+		self._docs: List[Document] = []
+		self._matrix: np.ndarray = np.empty((0, 0), dtype=self._dtype)
+		self._len = 0
+		self._lock = threading.Lock()
+		self._local = threading.local()
+
+	def _reserve(self, n: int, dim: int):
+		if self._len == 0 and self._matrix.shape[1] != dim:
+			self._matrix = np.empty((0, dim), dtype=self._dtype)
+		elif self._matrix.shape[1] != dim:
+			raise ValueError(f"Vector dimension {dim} does not match store dimension {self._matrix.shape[1]}")
+		cap = self._matrix.shape[0]
+		if self._len + n <= cap:
+			return
+		cap = max(cap, 16)
+		while cap < self._len + n:
+			cap *= 2
+		grown = np.empty((cap, dim), dtype=self._dtype)
+		grown[:self._len] = self._matrix[:self._len]
+		self._matrix = grown
+
+	def add(self, ids: List[str], vectors: Sequence[Sequence[float]], docs: List[Document]):
+		if not len(ids) == len(vectors) == len(docs):
+			raise ValueError(
+				f"add() got {len(ids)} ids, {len(vectors)} vectors and {len(docs)} docs; lengths must match"
+			)
+		if not len(ids):
+			return
+		block = _normalize_rows(np.array(vectors, dtype=np.float32, ndmin=2))
+		# ingest() adds from several threads; keep rows and docs aligned
+		with self._lock:
+			self._reserve(len(block), block.shape[1])
+			self._matrix[self._len:self._len + len(block)] = block
+			self._ids.extend(ids)
+			self._docs.extend(docs)
+			self._len += len(block)
+
+	def _score_buffer(self, n: int, cap: int) -> np.ndarray:
+		# Per-thread scratch sized to matrix capacity; reallocated only when
+		# the matrix has grown past it, so queries don't allocate a score array
+		buf = getattr(self._local, "scores", None)
+		if buf is None or len(buf) < n:
+			buf = self._local.scores = np.empty(cap, dtype=np.float32)
+		return buf[:n]
+
+	def _scores(self, matrix: np.ndarray, q: np.ndarray, cap: int) -> np.ndarray:
+		n = len(matrix)
+		scores = self._score_buffer(n, cap)
+		if matrix.dtype == np.float32:
+			return np.matmul(matrix, q, out=scores)
+		# One upcast buffer per query, reused across blocks
+		buf = np.empty((min(_SCORE_BLOCK, n), matrix.shape[1]), dtype=np.float32)
+		for start in range(0, n, _SCORE_BLOCK):
+			block = matrix[start:start + _SCORE_BLOCK]
+			m = len(block)
+			np.copyto(buf[:m], block)
+			np.matmul(buf[:m], q, out=scores[start:start + m])
+		return scores
+
+	def similarity_search(self, query_vector: Sequence[float], k: int = 4) -> List[Document]:
+		# Snapshot under the lock: add() may grow the matrix from ingest
+		# threads, and rows/docs past the snapshot are simply not searched
+		with self._lock:
+			matrix = self._matrix[:self._len]
+			cap = self._matrix.shape[0]
+			docs = self._docs
+		if len(matrix) == 0 or k <= 0:
+			return []
+		q = np.array(query_vector, dtype=np.float32)
+		if q.ndim != 1 or len(q) != matrix.shape[1]:
+			raise ValueError(
+				f"Query dimension {q.shape[-1] if q.ndim else 0} does not match store dimension {matrix.shape[1]}"
+			)
+		q /= np.linalg.norm(q) + 1e-12
+		return [docs[i] for i in _top_k(self._scores(matrix, q, cap), k)]
+
+	def save(self, path: str, key: str, backend: str):
+		"""Write vectors to ``path.npy`` and ids/docs to ``path.pkl``.
+
+		``key`` identifies the source data (e.g. the CSV hash) and ``backend``
+		the embedder that actually produced the vectors; load() only accepts
+		files whose key, backend and width match the current setup.
+		"""
+		with self._lock:
+			matrix = self._matrix[:self._len]
+			meta = {
+				"key": key,
+				"backend": backend,
+				"dim": matrix.shape[1],
+				"ids": list(self._ids),
+				"docs": list(self._docs),
+			}
+		with open(path + ".npy.tmp", "wb") as f:
+			np.save(f, matrix)
+		with open(path + ".pkl.tmp", "wb") as f:
+			pickle.dump(meta, f, protocol=pickle.HIGHEST_PROTOCOL)
+		os.replace(path + ".npy.tmp", path + ".npy")
+		os.replace(path + ".pkl.tmp", path + ".pkl")
+
+	def load(self, path: str, key: str, backend: str, dim: int) -> bool:
+		"""Memory-map vectors saved by save(); returns False if stale or missing.
+
+		The matrix is opened read-only, so pages are read on demand; a later
+		add() copies it into a fresh growable buffer.
+		"""
+		try:
+			with open(path + ".pkl", "rb") as f:
+				meta = pickle.load(f)
+			if meta.get("key") != key or meta.get("backend") != backend or meta.get("dim") != dim:
+				return False
+			matrix = np.load(path + ".npy", mmap_mode="r")
+		except Exception:
+			return False
+		if (
+			matrix.ndim != 2
+			or matrix.shape[1] != dim
+			or matrix.dtype != self._dtype
+			or len(matrix) != len(meta["ids"])
+		):
+			return False
+		with self._lock:
+			self._matrix = matrix
+			self._ids = meta["ids"]
+			self._docs = meta["docs"]
+			self._len = len(matrix)
+		return True
 
 
 # Optional Pinecone backend
@@ -74,10 +223,10 @@ class PineconeVectorStore:
 			self._pc.create_index(name=index_name, dimension=dimension, metric="cosine", spec=spec)
 		self._index = self._pc.Index(index_name)
 
-	def add(self, ids: List[str], vectors: List[List[float]], docs: List[Document]):
+	def add(self, ids: List[str], vectors: Sequence[Sequence[float]], docs: List[Document]):
 		# Only include small fields in metadata; do not store full text in metadata
 		upserts = []
-		for i, v, d in zip(ids, vectors, docs):
+		for i, v, d in zip(ids, np.asarray(vectors, dtype=np.float32).tolist(), docs):
 			meta = {k: v for k, v in d.metadata.items() if k in ["pmid", "title", "authors", "date", "full_text_link"]}
 			upserts.append({"id": i, "values": v, "metadata": meta})
 		# Upsert in small batches to avoid Pinecone payload limits